@@ -1,21 +1,51 @@
 """
-Updated Flask application for Parent‑AI Tutor with robust error handling.
+FastAPI application for Parent‑AI Tutor with robust error handling.
 
-This version improves the `get_ai_response` function by returning safe fallback
+The app is served by an ASGI server (uvicorn) and talks to OpenAI through the
+async client, so a single event loop can keep many `/chat` requests in flight
+while they wait on the network.  `get_ai_response` returns safe fallback
 messages instead of raising exceptions when the API key is missing or when an
-error occurs during the call to OpenAI.  It also removes references to
-`openai.error` to be compatible with recent versions of the openai library.
+error occurs during the call to OpenAI.
 """
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import os
 import logging
-from typing import Dict, Any
+import re
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Callable, Coroutine, List, Optional, Set, Tuple
 
-from flask import Flask, request, jsonify, render_template
 from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.routing import APIRoute
+from fastapi.exceptions import RequestValidationError
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+import httpx
 import openai
+from cachetools import LFUCache, TTLCache
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, multiprocess
+from prometheus_client.exposition import choose_encoder
+import orjson
+from pydantic import BaseModel, ConfigDict, Field
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # Redis is optional; the in-process cache works on its own
+    aioredis = None
+
+try:
+    import faiss
+    import numpy as np
+except ImportError:  # The semantic cache is optional and needs faiss-cpu + numpy
+    faiss = None
+    np = None
 
 # Load environment variables from .env file if present
 load_dotenv()
@@ -24,101 +54,669 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+if not hasattr(openai, "AsyncOpenAI"):
+    raise RuntimeError("openai>=1.0 is required; run `pip install -r requirements.txt` to upgrade it.")
+
 # Retrieve the OpenAI API key from the environment
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+client: Optional[openai.AsyncOpenAI] = None
 if OPENAI_API_KEY:
-    try:
-        # For openai>=1.0: create a client
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-    except AttributeError:
-        # For older openai versions: set global api key
-        openai.api_key = OPENAI_API_KEY
-        client = None
+    # Requests share one HTTP/2 connection pool so concurrent calls are
+    # multiplexed over a single TLS connection instead of queueing for
+    # HTTP/1.1 sockets.  Idle connections are kept for five minutes so quiet
+    # periods do not cost a fresh DNS lookup and TLS handshake.
+    client = openai.AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        http_client=httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32, keepalive_expiry=300.0),
+        ),
+    )
 else:
-    client = None
     logger.warning(
         "OPENAI_API_KEY is not set. The app will run but chat requests will return a fallback message."
     )
 
-# Initialise Flask app
-app = Flask(__name__)
+# The system prompt is byte-identical for every request (the child's age travels
+# in the user message) and longer than 1024 tokens, so OpenAI's automatic prompt
+# caching can reuse the already processed prefix at a discount.
+with open(os.path.join(BASE_DIR, "prompts", "system_prompt.txt"), encoding="utf-8") as fh:
+    SYSTEM_PROMPT = fh.read()
+
+# Built once at import: every request shares the same system message object and
+# looks up its age tag instead of formatting a new string.
+SYSTEM_MESSAGE: Dict[str, str] = {"role": "system", "content": SYSTEM_PROMPT}
+AGE_TAGS: Dict[int, str] = {age: f"[Child age: {age}]\n" for age in range(1, 19)}
+
+# Model settings.  Replies are cached, so keep sampling close to deterministic:
+# caching a high-temperature answer would freeze one arbitrary sample forever.
+OPENAI_MODEL = "gpt-4o-mini"
+# Typical answers are well under 200 tokens; raise to 384 if replies get truncated.
+OPENAI_MAX_TOKENS = 256
+OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.3"))
+CACHE_ENABLED = OPENAI_TEMPERATURE <= 0.3
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 2048))
+CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", 24))
+
+# Cache keys ignore case, whitespace and punctuation ("What is AI?" == "what is ai")
+# Decimal points survive so that "1.5" and "15" stay distinct
+_PUNCTUATION_RE = re.compile(r"[^\w\s.+\-*/=<>%#^]|\.(?!\d)|(?<!\d)\.")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Optional shared cache so that multiple workers benefit from each other's replies
+REDIS_URL = os.getenv("REDIS_URL")
+redis_client = None
+if REDIS_URL and CACHE_ENABLED:
+    if aioredis is None:
+        logger.warning("REDIS_URL is set but the redis package is not installed; using the in-process cache only.")
+    else:
+        redis_client = aioredis.Redis.from_url(REDIS_URL)
+
+# In-process reply caches.  Popular questions stay in the LFU cache however many
+# one-off questions arrive in between; the TTL cache holds recent replies that
+# have not been asked often enough to displace them.
+_frequent_cache: "LFUCache[str, str]" = LFUCache(maxsize=CACHE_MAX_ENTRIES)
+_recent_cache: "TTLCache[str, str]" = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_HOURS * 3600)
+
+# Semantic cache: rephrasings of an already answered question ("what is AI?" vs
+# "explain AI to my kid") are matched by embedding similarity, one index per age.
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+SEMANTIC_CACHE_ENABLED = CACHE_ENABLED and faiss is not None
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR")
+# The lookup delays every cache miss, so a slow embeddings call is abandoned
+# rather than retried and the question goes straight to the chat model
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "2"))
+
+_semantic_cache: Dict[int, Tuple[Any, List[str]]] = {}
+
+# Micro-batching: when enabled, questions for the same age that arrive within
+# BATCH_WINDOW_MS are answered by one chat completion (up to BATCH_MAX_SIZE
+# questions).  Batched replies cannot be streamed, so this is opt-in for bursty
+# deployments where per-call overhead matters more than time to first token.
+CHAT_BATCHING = os.getenv("CHAT_BATCHING", "").lower() in ("1", "true", "yes")
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+BATCH_WINDOW_MS = int(os.getenv("BATCH_WINDOW_MS", 250))
+
+_batch_pending: Dict[int, List[Tuple[str, "asyncio.Future[str]"]]] = {}
+_batch_timers: Dict[int, asyncio.TimerHandle] = {}
+_batch_tasks: Set["asyncio.Task[None]"] = set()
 
+# Front-door routing: greetings and thanks never need a cloud model, and very
+# short questions can be answered by a small local model (Ollama) if one is
+# configured.  Everything else goes to OpenAI.
+OLLAMA_URL = os.getenv("OLLAMA_URL")  # e.g. http://localhost:11434
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:1b")
+ollama_client = httpx.AsyncClient(base_url=OLLAMA_URL, timeout=10.0) if OLLAMA_URL else None
+
+_TRIVIAL_RE = re.compile(
+    r"(?P<keyword>hi|hello|hey|thanks|thank you|thx|bye|goodbye)( there| so much| a lot| everyone)?[\s!.,?]*",
+    re.IGNORECASE,
+)
+# The leading class excludes digits so the first digit is the only split point;
+# letting both classes match digits makes long messages backtrack quadratically
+_ARITHMETIC_RE = re.compile(r"(?:what['’]?s|what is)?[\s+\-*/x×÷().=?]*\d[\s\d+\-*/x×÷().=?]*", re.IGNORECASE)
+SIMPLE_MAX_LENGTH = 10
+MESSAGE_MAX_LENGTH = 2000
+
+CANNED_REPLIES: Dict[str, str] = {
+    "greeting": (
+        "Hello! Tell me your child’s age and ask anything about AI or technology, and I’ll suggest "
+        "a simple way to explain it together."
+    ),
+    "thanks": "You’re welcome! Feel free to ask another question whenever your child gets curious.",
+    "goodbye": "Goodbye, and have fun exploring technology together!",
+}
+_CANNED_CATEGORIES: Dict[str, str] = {
+    "hi": "greeting",
+    "hello": "greeting",
+    "hey": "greeting",
+    "thanks": "thanks",
+    "thank you": "thanks",
+    "thx": "thanks",
+    "bye": "goodbye",
+    "goodbye": "goodbye",
+}
+
+# Prometheus metrics, served at /metrics.  Under Gunicorn, set
+# PROMETHEUS_MULTIPROC_DIR so every worker's samples are aggregated.
+CHAT_REQUESTS = Counter("chat_requests", "Chat requests received.")
+CACHE_HITS = Counter("chat_cache_hits", "Chat replies served from a cache.", ["layer"])
+OPENAI_LATENCY = Histogram(
+    "openai_latency_seconds",
+    "Time taken by OpenAI chat completions, until the last token for streamed replies.",
+    buckets=(0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 30.0),
+)
+
+FALLBACK_MESSAGE = "The AI service is currently unavailable or encountered an error. Please try again later."
+
+
+def _normalize(message: str) -> str:
+    """Return a question lower-cased, without punctuation and with whitespace collapsed.
+
+    Only cache keys and embeddings use this form; the model always sees the
+    parent's original wording.  Operators such as `+` and `*` are kept so that
+    "2+2" and "2*2" stay distinct questions, as are decimal points between
+    digits so that "1.5+1.5" and "15+15" do.
+    """
+    return _WHITESPACE_RE.sub(" ", _PUNCTUATION_RE.sub("", message.lower())).strip()
+
+
+def _cache_key(message: str, age: int) -> str:
+    """Return the cache key for a question, ignoring case, punctuation and whitespace differences."""
+    return hashlib.sha256(f"{OPENAI_MODEL}|{age}|{_normalize(message)}".encode()).hexdigest()
+
+
+def _remember(key: str, reply: str) -> None:
+    """Store a reply in both in-process caches."""
+    _frequent_cache[key] = reply
+    _recent_cache[key] = reply
+
+
+async def _cache_get(key: str) -> Optional[str]:
+    """Return a cached reply from the LFU cache, the TTL cache or Redis, if any."""
+    reply = _frequent_cache.get(key)
+    if reply is not None:
+        return reply
+    reply = _recent_cache.get(key)
+    if reply is not None:
+        # Asked again since the LFU cache evicted it: give it another chance there
+        _frequent_cache[key] = reply
+        return reply
+    if redis_client is None:
+        return None
+    try:
+        raw = await redis_client.get(key)
+    except RedisError as exc:
+        logger.warning(f"Redis cache lookup failed: {exc}")
+        return None
+    if raw is None:
+        return None
+    reply = orjson.loads(raw)["content"]
+    _remember(key, reply)
+    return reply
 
-def get_ai_response(message: str, age: int) -> str:
-    """Return the assistant’s reply or a fallback message on error.
+
+async def _cache_put(key: str, reply: str) -> None:
+    """Store a reply in the in-process cache and, if configured, in Redis."""
+    _remember(key, reply)
+    if redis_client is None:
+        return
+    try:
+        await redis_client.setex(key, CACHE_TTL_HOURS * 3600, orjson.dumps({"content": reply}))
+    except RedisError as exc:
+        logger.warning(f"Redis cache write failed: {exc}")
+
+
+async def _embed(message: str) -> Optional["np.ndarray"]:
+    """Return the L2-normalised embedding of a question, or None on error."""
+    try:
+        response = await client.with_options(max_retries=0, timeout=EMBEDDING_TIMEOUT).embeddings.create(
+            model=EMBEDDING_MODEL, input=message
+        )
+    except Exception as exc:
+        logger.warning(f"Embedding request failed: {exc}")
+        return None
+    vector = np.asarray([response.data[0].embedding], dtype="float32")
+    faiss.normalize_L2(vector)
+    return vector
+
+
+def _semantic_get(vector: "np.ndarray", age: int) -> Optional[str]:
+    """Return the reply to the most similar cached question for this age, if close enough."""
+    entry = _semantic_cache.get(age)
+    if entry is None or entry[0].ntotal == 0:
+        return None
+    index, replies = entry
+    scores, ids = index.search(vector, 1)
+    if scores[0][0] < SEMANTIC_CACHE_THRESHOLD:
+        return None
+    return replies[ids[0][0]]
+
+
+def _semantic_put(vector: "np.ndarray", age: int, reply: str) -> None:
+    """Add a question embedding and its reply to the index for this age."""
+    if age not in _semantic_cache:
+        _semantic_cache[age] = (faiss.IndexFlatIP(EMBEDDING_DIMENSIONS), [])
+    index, replies = _semantic_cache[age]
+    if index.ntotal >= CACHE_MAX_ENTRIES:
+        return
+    index.add(vector)
+    replies.append(reply)
+
+
+def _semantic_cache_path(age: int) -> str:
+    """Return the file that holds the persisted semantic cache for an age."""
+    return os.path.join(SEMANTIC_CACHE_DIR, f"age_{age}.npz")
+
+
+def _load_semantic_cache() -> None:
+    """Load persisted semantic cache indexes from SEMANTIC_CACHE_DIR, if any."""
+    if not SEMANTIC_CACHE_DIR or not os.path.isdir(SEMANTIC_CACHE_DIR):
+        return
+    for age in range(1, 19):
+        path = _semantic_cache_path(age)
+        if not os.path.exists(path):
+            continue
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                vectors = data["vectors"].astype("float32")
+                replies = [str(reply) for reply in data["replies"]]
+        except Exception as exc:
+            logger.warning(f"Could not load semantic cache for age {age}: {exc}")
+            continue
+        if vectors.shape != (len(replies), EMBEDDING_DIMENSIONS):
+            logger.warning(f"Ignoring malformed semantic cache for age {age}")
+            continue
+        index = faiss.IndexFlatIP(EMBEDDING_DIMENSIONS)
+        index.add(vectors)
+        _semantic_cache[age] = (index, replies)
+
+
+def _save_semantic_cache() -> None:
+    """Persist the semantic cache indexes to SEMANTIC_CACHE_DIR on shutdown.
+
+    Each age's vectors and replies are written together to one file, via a
+    temporary file and an atomic rename, so a reader never sees a vector list
+    paired with another process's replies.  With several workers the last one
+    to shut down wins; entries only the other workers learned are dropped.
+    """
+    if not SEMANTIC_CACHE_DIR:
+        return
+    os.makedirs(SEMANTIC_CACHE_DIR, exist_ok=True)
+    for age, (index, replies) in _semantic_cache.items():
+        if index.ntotal == 0:
+            continue
+        path = _semantic_cache_path(age)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as fh:
+                np.savez(fh, vectors=index.reconstruct_n(0, index.ntotal), replies=np.array(replies, dtype=str))
+            os.replace(tmp_path, path)
+        except Exception as exc:
+            logger.warning(f"Could not save semantic cache for age {age}: {exc}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def classify_message(message: str) -> str:
+    """Label a message as TRIVIAL, SIMPLE or COMPLEX to decide which model answers it.
 
     Args:
-        message: The user’s input question.
-        age: The child’s age, used to tailor the system prompt.
+        message: The user’s input question, already stripped.
 
     Returns:
-        A string containing the AI’s response or a fallback message.
+        "TRIVIAL" for greetings, thanks and goodbyes, "SIMPLE" for very short
+        messages and bare arithmetic, and "COMPLEX" for everything else.
+    """
+    if _TRIVIAL_RE.fullmatch(message):
+        return "TRIVIAL"
+    if len(message) < SIMPLE_MAX_LENGTH or _ARITHMETIC_RE.fullmatch(message):
+        return "SIMPLE"
+    return "COMPLEX"
+
+
+def _canned_reply(message: str) -> str:
+    """Return the canned reply for a TRIVIAL message.
+
+    The keyword is taken from the `_TRIVIAL_RE` match and case-folded, since
+    IGNORECASE also matches forms such as "Hİ" that `.lower()` does not map
+    back to a known keyword; anything unrecognised gets the greeting.
+    """
+    match = _TRIVIAL_RE.fullmatch(message)
+    keyword = match["keyword"].casefold() if match else ""
+    return CANNED_REPLIES[_CANNED_CATEGORIES.get(keyword, "greeting")]
+
+
+async def _local_completion(message: str, age: int) -> Optional[str]:
+    """Answer a simple question with the local Ollama model, or return None on error."""
+    try:
+        response = await ollama_client.post(
+            "/api/chat",
+            json={
+                "model": OLLAMA_MODEL,
+                "messages": (SYSTEM_MESSAGE, {"role": "user", "content": _user_prompt(message, age)}),
+                "stream": False,
+            },
+        )
+        response.raise_for_status()
+        reply = response.json()["message"]["content"].strip()
+    except Exception as exc:
+        logger.warning(f"Local model request failed, falling back to OpenAI: {exc}")
+        return None
+    return reply or None
+
+
+def _record_usage(usage: Any) -> None:
+    """Count a completion whose prompt prefix was served from OpenAI's prompt cache."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None and (details.cached_tokens or 0) > 0:
+        CACHE_HITS.labels(layer="prefix").inc()
+
+
+def _user_prompt(message: str, age: int) -> str:
+    """Return the user message, prefixed with the child's age for the system prompt to act on."""
+    return AGE_TAGS[age] + message
+
+
+async def _batched_completion(message: str, age: int) -> str:
+    """Queue a question for the next batch for this age and wait for its answer."""
+    loop = asyncio.get_running_loop()
+    future: "asyncio.Future[str]" = loop.create_future()
+    bucket = _batch_pending.setdefault(age, [])
+    bucket.append((message, future))
+    if len(bucket) >= BATCH_MAX_SIZE:
+        _flush_batch(age)
+    elif len(bucket) == 1:
+        _batch_timers[age] = loop.call_later(BATCH_WINDOW_MS / 1000, _flush_batch, age)
+    return await future
+
+
+def _flush_batch(age: int) -> None:
+    """Send all pending questions for an age as one batch."""
+    timer = _batch_timers.pop(age, None)
+    if timer is not None:
+        timer.cancel()
+    batch = _batch_pending.pop(age, [])
+    if batch:
+        task = asyncio.ensure_future(_run_batch(age, batch))
+        _batch_tasks.add(task)
+        task.add_done_callback(_batch_tasks.discard)
+
+
+async def _run_batch(age: int, batch: List[Tuple[str, "asyncio.Future[str]"]]) -> None:
+    """Answer a batch of questions with a single chat completion and resolve their futures."""
+    questions = [question for question, _ in batch]
+    try:
+        if len(questions) == 1:
+            with OPENAI_LATENCY.time():
+                response = await client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=(SYSTEM_MESSAGE, {"role": "user", "content": _user_prompt(questions[0], age)}),
+                    temperature=OPENAI_TEMPERATURE,
+                    max_tokens=OPENAI_MAX_TOKENS,
+                )
+            _record_usage(response.usage)
+            answers = [response.choices[0].message.content.strip()]
+        else:
+            numbered = "\n".join(f"Q{i}: {question}" for i, question in enumerate(questions, 1))
+            with OPENAI_LATENCY.time():
+                response = await client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=(
+                        SYSTEM_MESSAGE,
+                        {
+                            "role": "user",
+                            "content": _user_prompt(
+                                "Answer each question below separately, as if it were asked on its own. "
+                                'Reply with a JSON object of the form {"answers": ["...", ...]} containing '
+                                f"exactly {len(questions)} answers in the same order.\n\n{numbered}",
+                                age,
+                            ),
+                        },
+                    ),
+                    temperature=OPENAI_TEMPERATURE,
+                    max_tokens=OPENAI_MAX_TOKENS * len(questions),
+                    response_format={"type": "json_object"},
+                )
+            _record_usage(response.usage)
+            answers = orjson.loads(response.choices[0].message.content)["answers"]
+            if len(answers) != len(questions) or not all(isinstance(a, str) for a in answers):
+                raise ValueError(f"batched reply did not contain {len(questions)} answers")
+            answers = [answer.strip() for answer in answers]
+    except Exception as exc:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(exc)
+        return
+    for (_, future), answer in zip(batch, answers):
+        if not future.done():
+            future.set_result(answer)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Load caches and warm up the OpenAI connection on start-up; flush and close on shutdown."""
+    if SEMANTIC_CACHE_ENABLED:
+        _load_semantic_cache()
+    if client is not None:
+        # A cheap request opens the HTTP/2 connection before the first parent asks
+        try:
+            await client.with_options(max_retries=0).models.list()
+        except Exception as exc:
+            logger.warning(f"Could not pre-warm the OpenAI connection: {exc}")
+    yield
+    if SEMANTIC_CACHE_ENABLED:
+        _save_semantic_cache()
+    if client is not None:
+        await client.close()
+    if ollama_client is not None:
+        await ollama_client.aclose()
+
+
+class ChatRequest(BaseModel):
+    """JSON body of `POST /chat`, parsed and validated in one pass by pydantic-core."""
+
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+    message: str = Field(min_length=1, max_length=MESSAGE_MAX_LENGTH)
+    age: int = Field(ge=1, le=18)
+
+
+class ORJSONRequest(Request):
+    """Request whose JSON body is parsed with orjson instead of the stdlib json module."""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """Route that hands its endpoint an `ORJSONRequest`."""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def orjson_route_handler(request: Request) -> Response:
+            return await handler(ORJSONRequest(request.scope, request.receive))
+
+        return orjson_route_handler
+
+
+# Initialise FastAPI app
+app = FastAPI(lifespan=lifespan)
+app.router.route_class = ORJSONRoute
+# Compress the page and other sizeable responses.  The SSE stream is left
+# uncompressed (Starlette excludes text/event-stream) so events are not buffered.
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
+
+def _metrics_registry() -> CollectorRegistry:
+    """Return the registry to expose at `/metrics`, aggregating workers if configured."""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+METRICS_REGISTRY = _metrics_registry()
+app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
+templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
+
+# index.html has no per-request content, so render it once.  Static asset URLs
+# are resolved as root-relative paths, which need no request.
+INDEX_HTML = templates.env.get_template("index.html").render(url_for=app.url_path_for).encode()
+INDEX_HEADERS = {"Cache-Control": "public, max-age=3600, immutable"}
+
+
+async def get_ai_response(message: str, age: int) -> AsyncIterator[str]:
+    """Yield the assistant’s reply as it is generated, or a fallback message on error.
+
+    Canned, local-model, cached and batched replies are yielded in one piece;
+    other replies are streamed token by token from OpenAI so the first words
+    reach the parent as soon as possible.
+
+    Args:
+        message: The user’s input question, already stripped by `ChatRequest`.
+        age: The child’s age, used to tailor the answer.
+
+    Yields:
+        Fragments of the AI’s response, or a single fallback message.
     """
+    # Greetings and other trivial messages get a canned reply, and simple ones
+    # are tried on the local model before escalating to OpenAI
+    label = classify_message(message)
+    if label == "TRIVIAL":
+        yield _canned_reply(message)
+        return
+    if label == "SIMPLE" and ollama_client is not None:
+        reply = await _local_completion(message, age)
+        if reply is not None:
+            yield reply
+            return
     # If the API key is missing, return fallback message
-    if not OPENAI_API_KEY:
-        return (
+    if client is None:
+        yield (
             "I’m sorry, but the AI service is not configured. Please set the OPENAI_API_KEY "
             "environment variable to enable responses."
         )
-    # Compose the system prompt
-    system_prompt = (
-        "You are an AI tutor helping parents explain artificial intelligence and technology "
-        "concepts to their child. The child is {} years old. Speak directly to the parent "
-        "and provide simple, age‑appropriate explanations, analogies and suggestions. Avoid jargon."
-    ).format(age)
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": message.strip()},
-    ]
+        return
+    # Emoji- or punctuation-only messages normalise to nothing; caching them
+    # would give every such message the same key and embedding
+    normalized = _normalize(message)
+    cache_key = _cache_key(message, age) if CACHE_ENABLED and normalized else None
+    if cache_key:
+        cached = await _cache_get(cache_key)
+        if cached is not None:
+            CACHE_HITS.labels(layer="exact").inc()
+            yield cached
+            return
+    vector = await _embed(normalized) if SEMANTIC_CACHE_ENABLED and normalized else None
+    if vector is not None:
+        cached = _semantic_get(vector, age)
+        if cached is not None:
+            CACHE_HITS.labels(layer="semantic").inc()
+            await _cache_put(cache_key, cached)
+            yield cached
+            return
+    parts: List[str] = []
     try:
-        # Call OpenAI depending on version
-        if client:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=512,
-            )
-            content = response.choices[0].message.content
+        if CHAT_BATCHING:
+            parts.append(await _batched_completion(message, age))
+            yield parts[0]
         else:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=512,
-            )
-            content = response["choices"][0]["message"]["content"]
-        return content.strip()
+            with OPENAI_LATENCY.time():
+                stream = await client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    # A tuple around the shared system message: one small allocation per call
+                    messages=(SYSTEM_MESSAGE, {"role": "user", "content": _user_prompt(message, age)}),
+                    temperature=OPENAI_TEMPERATURE,
+                    max_tokens=OPENAI_MAX_TOKENS,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                # Closing the stream on exit, including client disconnects,
+                # stops OpenAI from generating tokens nobody will read
+                async with stream:
+                    async for chunk in stream:
+                        if chunk.usage is not None:
+                            _record_usage(chunk.usage)
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            parts.append(delta)
+                            yield delta
     except Exception as exc:
         logger.error(f"AI request failed: {exc}")
-        return "The AI service is currently unavailable or encountered an error. Please try again later."
+        yield f"\n\n{FALLBACK_MESSAGE}" if parts else FALLBACK_MESSAGE
+        return
+    reply = "".join(parts).strip()
+    if not reply:
+        return
+    if cache_key:
+        await _cache_put(cache_key, reply)
+    if vector is not None:
+        _semantic_put(vector, age, reply)
 
 
-@app.route("/")
-def index() -> str:
-    """Render the main chat page."""
-    return render_template("index.html")
+async def _sse(fragments: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    """Wrap reply fragments as Server-Sent Events carrying `{"response": ...}` JSON."""
+    try:
+        async for fragment in fragments:
+            yield b"data: " + orjson.dumps({"response": fragment}) + b"\n\n"
+    finally:
+        await fragments.aclose()
 
 
-@app.route("/chat", methods=["POST"])
-def chat() -> (Any, int):
-    """Process a chat request and return JSON response."""
-    data: Dict[str, Any] = request.get_json(silent=True) or {}
-    message = data.get("message", "").strip()
-    age = data.get("age")
-    if not message:
-        return jsonify({"error": "No message provided."}), 400
-    try:
-        age_int = int(age)
-        if age_int < 1 or age_int > 18:
-            return jsonify({"error": "Please enter an age between 1 and 18."}), 400
-    except (TypeError, ValueError):
-        return jsonify({"error": "Invalid age provided."}), 400
-    reply = get_ai_response(message, age_int)
-    return jsonify({"response": reply})
+class EventStreamResponse(StreamingResponse):
+    """Server-Sent Events response that closes its generator even if the client disconnects.
+
+    Starlette stops iterating when the client goes away but leaves the generator
+    suspended until garbage collection, which would keep the OpenAI stream open.
+    """
+
+    media_type = "text/event-stream"
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+
+@app.get("/", response_class=HTMLResponse)
+async def index() -> HTMLResponse:
+    """Serve the main chat page, pre-rendered at start-up."""
+    return HTMLResponse(INDEX_HTML, headers=INDEX_HEADERS)
+
+
+# Served as a plain route rather than prometheus_client's ASGI app, which would
+# gzip the body a second time behind GZipMiddleware
+@app.get("/metrics", include_in_schema=False)
+def metrics(request: Request) -> Response:
+    """Serve Prometheus metrics in the exposition format the scraper asks for."""
+    encoder, content_type = choose_encoder(request.headers.get("accept", ""))
+    return Response(encoder(METRICS_REGISTRY), media_type=content_type)
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_error(request: Request, exc: RequestValidationError) -> Response:
+    """Turn a validation failure into the `{"error": ...}` message the front-end displays."""
+    error = exc.errors()[0]
+    field = error["loc"][-1] if error["loc"] else None
+    if field == "age":
+        if error["type"] in ("greater_than_equal", "less_than_equal"):
+            message = "Please enter an age between 1 and 18."
+        else:
+            message = "Invalid age provided."
+    elif error["type"] == "string_too_long":
+        message = f"Please keep your question under {MESSAGE_MAX_LENGTH:,} characters."
+    else:
+        message = "No message provided."
+    return Response(orjson.dumps({"error": message}), status_code=422, media_type="application/json")
+
+
+@app.post("/chat")
+async def chat(req: ChatRequest) -> Response:
+    """Process a chat request and stream the reply as Server-Sent Events."""
+    CHAT_REQUESTS.inc()
+    return EventStreamResponse(
+        _sse(get_ai_response(req.message, req.age)),
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 if __name__ == "__main__":
+    import uvicorn
+
+    # Local development only; production runs under Gunicorn (see Procfile).
     # Use environment PORT if provided (Render sets PORT) else default 5000
     port = int(os.getenv("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
+    uvicorn.run("app:app", host="0.0.0.0", port=port, reload=bool(os.getenv("DEV")))